@@ -1,17 +1,30 @@
+import array
 import asyncio
-import random
 import time
-from typing import Dict, List, Optional
+from collections import deque
+from graphlib import TopologicalSorter
+import numpy as np
+from typing import Dict, List, Optional, Set
 from fastapi import FastAPI, HTTPException, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict
 import logging
 import json
 
+try:
+    # uvicorn already picks uvloop itself (--loop auto) before importing this
+    # module; this only matters for other ASGI runners. uvloop is Linux/macOS
+    # only, so fall back to the default loop elsewhere.
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Microservice Health Simulator")
+app = FastAPI(title="Microservice Health Simulator", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,6 +34,8 @@ app.add_middleware(
 )
 
 class ServiceMetrics(BaseModel):
+    model_config = ConfigDict(extra='forbid', frozen=True)
+
     service_id: str
     status: str
     latency_ms: float
@@ -31,6 +46,8 @@ class ServiceMetrics(BaseModel):
     failed_requests: int
 
 class ServiceGraph(BaseModel):
+    model_config = ConfigDict(extra='forbid', frozen=True)
+
     services: List[ServiceMetrics]
     dependencies: Dict[str, List[str]]
 
@@ -51,108 +68,220 @@ class MicroserviceSimulator:
             "db-service": {"deps": [], "error_prob": 0.02},
             "cache-service": {"deps": [], "error_prob": 0.03},
         }
-        self.metrics = {sid: {"latency": [], "errors": 0, "success": 0, "start_time": time.time(), "forced_failure": None} 
+        self.metrics = {sid: {"latency": deque(maxlen=100), "lat_sum": 0.0, "lat_count": 0, "errors": 0, "success": 0, "start_time": time.monotonic()} 
                        for sid in self.services}
-        self.lock = asyncio.Lock()
+        # Forced-failure deadlines (monotonic seconds, 0.0 = none) live in one
+        # flat array so the per-call check is a lock-free float read
+        self._sid_index = {sid: i for i, sid in enumerate(self.services)}
+        self._force_until = array.array('d', [0.0] * len(self.services))
         self.running = False
+        self._cache_lock = asyncio.Lock()
+        self._cached_graph: Optional[ServiceGraph] = None
+        self._cached_json: Optional[str] = None
+        self._cached_at = 0.0
+        self._cache_ttl = 0.25
+        self._dep_map = {sid: self.services[sid]["deps"] for sid in self.services}
+        self._dep_generations = self._build_dep_generations()
+        self._rng = np.random.default_rng()
+        self._ws_clients: Set[WebSocket] = set()
+        self._ws_lock = asyncio.Lock()
+        self._broadcast_interval = 2.0
+        self._send_timeout = 1.0
+        self._last_broadcast = 0.0
 
-    async def simulate_service_call(self, service_id: str) -> tuple[bool, float]:
-        """Simulate a service call with latency and potential failure"""
-        base_latency = random.uniform(10, 100)
-        
-        async with self.lock:
-            if self.metrics[service_id]["forced_failure"]:
-                if time.time() < self.metrics[service_id]["forced_failure"]:
-                    return False, base_latency * 3
-                else:
-                    self.metrics[service_id]["forced_failure"] = None
+    def _build_dep_generations(self) -> List[List[str]]:
+        """Group services into batches where every dependency precedes its callers"""
+        sorter = TopologicalSorter(self._dep_map)
+        sorter.prepare()
+        generations = []
+        while sorter.is_active():
+            ready = list(sorter.get_ready())
+            generations.append(ready)
+            sorter.done(*ready)
+        return generations
+
+    async def simulate_service_call(self, service_id: str, base_latency: float, err_roll: float) -> tuple[bool, float]:
+        """Simulate a service call with latency and potential failure from pre-drawn samples"""
+        deadline = self._force_until[self._sid_index[service_id]]
+        if deadline and time.monotonic() < deadline:
+            return False, base_latency * 3
         
         error_prob = self.services[service_id]["error_prob"]
-        success = random.random() > error_prob
+        success = err_roll > error_prob
         
         latency = base_latency if success else base_latency * 2
         await asyncio.sleep(latency / 1000)
         
-        async with self.lock:
-            self.metrics[service_id]["latency"].append(latency)
-            if len(self.metrics[service_id]["latency"]) > 100:
-                self.metrics[service_id]["latency"].pop(0)
-            
-            if success:
-                self.metrics[service_id]["success"] += 1
-            else:
-                self.metrics[service_id]["errors"] += 1
+        # Counter updates have no await points, so they are atomic under the
+        # cooperative single-threaded event loop; do not call from threads.
+        data = self.metrics[service_id]
+        window = data["latency"]
+        if len(window) == window.maxlen:
+            data["lat_sum"] -= window[0]
+        else:
+            data["lat_count"] += 1
+        window.append(latency)
+        data["lat_sum"] += latency
+        
+        if success:
+            data["success"] += 1
+        else:
+            data["errors"] += 1
         
         return success, latency
 
-    async def simulate_request_flow(self, service_id: str):
-        """Simulate request through service and its dependencies"""
-        success, latency = await self.simulate_service_call(service_id)
+    async def simulate_tick(self, active: set[str], base_latencies: Dict[str, float], err_rolls: Dict[str, float]):
+        """Simulate requests into the active services, calling each involved service at most once per tick"""
+        # Callers run before their dependencies (reverse topological order), so
+        # a dependency is only called when an active caller succeeded, and a
+        # shared leaf like db-service is called once rather than once per caller
+        needed = set(active)
+        outcomes: Dict[str, bool] = {}
+        for generation in reversed(self._dep_generations):
+            batch = [sid for sid in generation if sid in needed]
+            if not batch:
+                continue
+            
+            results = await asyncio.gather(
+                *(self.simulate_service_call(sid, base_latencies[sid], err_rolls[sid]) for sid in batch),
+                return_exceptions=True
+            )
+            for sid, result in zip(batch, results):
+                success = not isinstance(result, BaseException) and result[0]
+                outcomes[sid] = success
+                if success and sid in active:
+                    needed.update(self._dep_map[sid])
         
-        if success:
-            for dep in self.services[service_id]["deps"]:
-                dep_success, _ = await self.simulate_service_call(dep)
-                if not dep_success:
-                    async with self.lock:
-                        self.metrics[service_id]["errors"] += 1
-                        self.metrics[service_id]["success"] -= 1
-                    break
+        for sid in active:
+            if outcomes[sid] and not all(outcomes[dep] for dep in self._dep_map[sid]):
+                self.metrics[sid]["errors"] += 1
+                self.metrics[sid]["success"] -= 1
 
     async def run_simulation(self):
         """Main simulation loop"""
         self.running = True
         while self.running:
-            tasks = []
-            for service_id in self.services:
-                if random.random() < 0.3:
-                    tasks.append(self.simulate_request_flow(service_id))
+            # Draw every random sample for the tick in one vectorized batch
+            n = len(self.services)
+            rolls = self._rng.random(n).tolist()
+            base_latencies = dict(zip(self.services, self._rng.uniform(10, 100, size=n).tolist()))
+            err_rolls = dict(zip(self.services, self._rng.random(n).tolist()))
+            active = {sid for sid, roll in zip(self.services, rolls) if roll < 0.3}
+            
+            if active:
+                await self.simulate_tick(active, base_latencies, err_rolls)
             
-            if tasks:
-                await asyncio.gather(*tasks, return_exceptions=True)
+            if time.monotonic() - self._last_broadcast >= self._broadcast_interval:
+                await self.broadcast()
             
             await asyncio.sleep(0.5)
 
+    async def add_client(self, websocket: WebSocket):
+        """Register a WebSocket to receive metrics broadcasts"""
+        async with self._ws_lock:
+            self._ws_clients.add(websocket)
+
+    async def remove_client(self, websocket: WebSocket):
+        """Stop sending metrics broadcasts to a WebSocket"""
+        async with self._ws_lock:
+            self._ws_clients.discard(websocket)
+
+    async def broadcast(self):
+        """Push one pre-encoded metrics snapshot to every connected client
+        
+        Each send is bounded by a timeout so a stalled client cannot hold up
+        the simulation tick or the other clients; it is dropped instead.
+        """
+        self._last_broadcast = time.monotonic()
+        async with self._ws_lock:
+            clients = list(self._ws_clients)
+        if not clients:
+            return
+        
+        payload = await self.get_metrics_json()
+        results = await asyncio.gather(
+            *(asyncio.wait_for(client.send_text(payload), timeout=self._send_timeout) for client in clients),
+            return_exceptions=True
+        )
+        failed = [client for client, result in zip(clients, results) if isinstance(result, BaseException)]
+        if failed:
+            await asyncio.gather(*(self._drop_client(client) for client in failed))
+
+    async def _drop_client(self, websocket: WebSocket):
+        """Deregister a client whose send failed and close it so it sees a disconnect"""
+        await self.remove_client(websocket)
+        try:
+            await asyncio.wait_for(websocket.close(code=1011), timeout=self._send_timeout)
+        except Exception:
+            pass
+
     async def get_metrics(self) -> ServiceGraph:
-        """Get current metrics for all services"""
-        async with self.lock:
-            services = []
-            for sid, data in self.metrics.items():
-                total = data["success"] + data["errors"]
-                latencies = data["latency"]
-                uptime = time.time() - data["start_time"]
-                
-                avg_latency = sum(latencies) / len(latencies) if latencies else 0
-                error_rate = (data["errors"] / total * 100) if total > 0 else 0
-                success_rate = (data["success"] / total * 100) if total > 0 else 100
-                
-                if data["forced_failure"] and time.time() < data["forced_failure"]:
-                    status = "failing"
-                elif error_rate > 20:
-                    status = "degraded"
-                else:
-                    status = "healthy"
-                
-                services.append(ServiceMetrics(
-                    service_id=sid,
-                    status=status,
-                    latency_ms=round(avg_latency, 2),
-                    error_rate=round(error_rate, 2),
-                    success_rate=round(success_rate, 2),
-                    uptime=round(uptime, 2),
-                    total_requests=total,
-                    failed_requests=data["errors"]
-                ))
+        """Get current metrics for all services, shared across callers for a short TTL"""
+        now = time.monotonic()
+        if self._cached_graph is not None and now - self._cached_at < self._cache_ttl:
+            return self._cached_graph
+        
+        async with self._cache_lock:
+            # Another caller may have refreshed the cache while we waited
+            if self._cached_graph is None or time.monotonic() - self._cached_at >= self._cache_ttl:
+                self._cached_graph = await self._build_metrics()
+                self._cached_json = self._cached_graph.model_dump_json()
+                self._cached_at = time.monotonic()
+            return self._cached_graph
+
+    async def get_metrics_json(self) -> str:
+        """Get the cached metrics snapshot pre-encoded as JSON"""
+        await self.get_metrics()
+        return self._cached_json
+
+    async def _build_metrics(self) -> ServiceGraph:
+        """Compute a fresh metrics snapshot for all services"""
+        services = []
+        now = time.monotonic()
+        # No await happens while reading a service, so each snapshot is consistent
+        for sid, idx in self._sid_index.items():
+            data = self.metrics[sid]
+            errors = data["errors"]
+            success = data["success"]
+            lat_sum = data["lat_sum"]
+            lat_count = data["lat_count"]
+            start_time = data["start_time"]
+            deadline = self._force_until[idx]
+            
+            total = success + errors
+            uptime = now - start_time
+            
+            avg_latency = lat_sum / lat_count if lat_count else 0
+            error_rate = (errors / total * 100) if total > 0 else 0
+            success_rate = (success / total * 100) if total > 0 else 100
             
-            dependencies = {sid: self.services[sid]["deps"] for sid in self.services}
-            return ServiceGraph(services=services, dependencies=dependencies)
+            if deadline and now < deadline:
+                status = "failing"
+            elif error_rate > 20:
+                status = "degraded"
+            else:
+                status = "healthy"
+            
+            services.append(ServiceMetrics(
+                service_id=sid,
+                status=status,
+                latency_ms=round(avg_latency, 2),
+                error_rate=round(error_rate, 2),
+                success_rate=round(success_rate, 2),
+                uptime=round(uptime, 2),
+                total_requests=total,
+                failed_requests=errors
+            ))
+        
+        return ServiceGraph(services=services, dependencies=self._dep_map)
 
     async def force_failure(self, service_id: str, duration: int):
         """Force a service to fail for a duration"""
         if service_id not in self.services:
             raise ValueError(f"Service {service_id} not found")
         
-        async with self.lock:
-            self.metrics[service_id]["forced_failure"] = time.time() + duration
+        self._force_until[self._sid_index[service_id]] = time.monotonic() + duration
+        self._cached_graph = None
         
         logger.info(f"Forced failure on {service_id} for {duration}s")
 
@@ -174,18 +303,24 @@ async def get_services():
 @app.get("/metrics")
 async def get_metrics():
     graph = await simulator.get_metrics()
-    total_requests = sum(s.total_requests for s in graph.services)
-    total_errors = sum(s.failed_requests for s in graph.services)
-    avg_latency = sum(s.latency_ms for s in graph.services) / len(graph.services)
+    total_requests = total_errors = 0
+    latency_sum = 0.0
+    status_counts = {"healthy": 0, "degraded": 0, "failing": 0}
+    for s in graph.services:
+        total_requests += s.total_requests
+        total_errors += s.failed_requests
+        latency_sum += s.latency_ms
+        status_counts[s.status] += 1
+    avg_latency = latency_sum / len(graph.services)
     
     return {
         "total_requests": total_requests,
         "total_errors": total_errors,
         "avg_latency_ms": round(avg_latency, 2),
         "services_count": len(graph.services),
-        "healthy_services": len([s for s in graph.services if s.status == "healthy"]),
-        "degraded_services": len([s for s in graph.services if s.status == "degraded"]),
-        "failing_services": len([s for s in graph.services if s.status == "failing"])
+        "healthy_services": status_counts["healthy"],
+        "degraded_services": status_counts["degraded"],
+        "failing_services": status_counts["failing"]
     }
 
 @app.post("/simulate-failure")
@@ -202,11 +337,14 @@ async def websocket_endpoint(websocket: WebSocket):
     logger.info("WebSocket client connected")
     
     try:
+        # Send a snapshot right away, then rely on the simulator's broadcasts
+        await websocket.send_text(await simulator.get_metrics_json())
+        await simulator.add_client(websocket)
+        # Park until the client goes away; receive raises on disconnect
         while True:
-            graph = await simulator.get_metrics()
-            await websocket.send_json(graph.dict())
-            await asyncio.sleep(2)
+            await websocket.receive_text()
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
     finally:
+        await simulator.remove_client(websocket)
         logger.info("WebSocket client disconnected")
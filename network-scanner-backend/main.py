@@ -2,16 +2,27 @@ import asyncio
 import socket
 import time
 import ipaddress
-from typing import List, Dict, Optional
+import functools
+from typing import List, Dict, Optional, Tuple
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field, validator
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict, Field, validator
 import logging
 
+try:
+    # uvicorn already picks uvloop itself (--loop auto) before importing this
+    # module; this only matters for other ASGI runners. uvloop is Linux/macOS
+    # only, so fall back to the default loop elsewhere.
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Network Inspection Platform")
+app = FastAPI(title="Network Inspection Platform", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,6 +34,10 @@ app.add_middleware(
 MAX_PORT_RANGE = 1024
 MAX_TIMEOUT_MS = 5000
 MAX_CONCURRENT = 100
+DNS_CACHE_TTL = 60.0
+DNS_CACHE_SIZE = 1024
+
+_dns_cache: Dict[str, Tuple[str, float]] = {}
 
 class ScanRequest(BaseModel):
     host: str = Field(..., min_length=1, max_length=255)
@@ -46,16 +61,21 @@ class ScanRequest(BaseModel):
         return v
 
 class PortResult(BaseModel):
+    model_config = ConfigDict(extra='forbid', frozen=True)
+
     port: int
     status: str
     latencyMs: Optional[float]
 
 class ScanResponse(BaseModel):
+    model_config = ConfigDict(extra='forbid', frozen=True)
+
     host: str
     resolvedIp: str
     scanSummary: Dict
     results: List[PortResult]
 
+@functools.lru_cache(maxsize=4096)
 def is_private_ip(ip: str) -> bool:
     """Check if IP is private/localhost"""
     try:
@@ -67,8 +87,20 @@ def is_private_ip(ip: str) -> bool:
 async def resolve_host(host: str) -> str:
     """Resolve hostname to IP with SSRF protection"""
     try:
-        loop = asyncio.get_event_loop()
-        ip = await loop.run_in_executor(None, socket.gethostbyname, host)
+        cached = _dns_cache.get(host)
+        if cached and time.monotonic() - cached[1] < DNS_CACHE_TTL:
+            ip = cached[0]
+        else:
+            loop = asyncio.get_running_loop()
+            infos = await loop.getaddrinfo(host, None, family=socket.AF_INET, type=socket.SOCK_STREAM)
+            ip = infos[0][4][0]
+            
+            # Re-insert the host so eviction stays oldest-first, and only
+            # evict when the host is new to the cache
+            _dns_cache.pop(host, None)
+            if len(_dns_cache) >= DNS_CACHE_SIZE:
+                _dns_cache.pop(next(iter(_dns_cache)))
+            _dns_cache[host] = (ip, time.monotonic())
         
         if is_private_ip(ip):
             raise ValueError(f"Cannot scan private/internal IP: {ip}")
@@ -78,34 +110,42 @@ async def resolve_host(host: str) -> str:
     except socket.gaierror:
         raise ValueError(f"Cannot resolve hostname: {host}")
 
-async def scan_port(ip: str, port: int, timeout: float, semaphore: asyncio.Semaphore) -> PortResult:
-    """Scan single port with concurrency control"""
-    async with semaphore:
-        start = time.time()
-        try:
-            conn = asyncio.open_connection(ip, port)
-            reader, writer = await asyncio.wait_for(conn, timeout=timeout)
-            writer.close()
-            await writer.wait_closed()
-            latency = (time.time() - start) * 1000
-            return PortResult(port=port, status="open", latencyMs=round(latency, 2))
-        except asyncio.TimeoutError:
-            return PortResult(port=port, status="timeout", latencyMs=None)
-        except (ConnectionRefusedError, OSError):
-            return PortResult(port=port, status="closed", latencyMs=None)
-
-async def scan_ports(ip: str, start_port: int, end_port: int, timeout_ms: int) -> List[PortResult]:
-    """Scan port range with bounded concurrency"""
+async def scan_port(ip: str, port: int, timeout: float) -> Dict:
+    """Scan single port, returning a plain dict validated later as a PortResult"""
+    # A bare non-blocking socket is enough to detect the handshake; no
+    # stream reader/writer or transport is needed
+    loop = asyncio.get_running_loop()
+    sock = None
+    start = time.time()
+    try:
+        # Socket creation can fail under load (EMFILE/ENFILE); report it per port
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        await asyncio.wait_for(loop.sock_connect(sock, (ip, port)), timeout=timeout)
+        latency = (time.time() - start) * 1000
+        return {"port": port, "status": "open", "latencyMs": round(latency, 2)}
+    except asyncio.TimeoutError:
+        return {"port": port, "status": "timeout", "latencyMs": None}
+    except (ConnectionRefusedError, OSError):
+        return {"port": port, "status": "closed", "latencyMs": None}
+    finally:
+        if sock is not None:
+            sock.close()
+
+async def scan_ports(ip: str, start_port: int, end_port: int, timeout_ms: int) -> List[Dict]:
+    """Scan port range in sweeps of at most MAX_CONCURRENT probes"""
     timeout = timeout_ms / 1000.0
-    semaphore = asyncio.Semaphore(MAX_CONCURRENT)
+    results: List[Optional[Dict]] = [None] * (end_port - start_port + 1)
     
-    tasks = [
-        scan_port(ip, port, timeout, semaphore)
-        for port in range(start_port, end_port + 1)
-    ]
+    for chunk_start in range(start_port, end_port + 1, MAX_CONCURRENT):
+        chunk_end = min(chunk_start + MAX_CONCURRENT, end_port + 1)
+        chunk = await asyncio.gather(*(
+            scan_port(ip, port, timeout)
+            for port in range(chunk_start, chunk_end)
+        ))
+        results[chunk_start - start_port:chunk_end - start_port] = chunk
     
-    results = await asyncio.gather(*tasks)
-    return list(results)
+    return results
 
 @app.post("/scan", response_model=ScanResponse)
 async def scan_endpoint(request: ScanRequest):
@@ -116,20 +156,28 @@ async def scan_endpoint(request: ScanRequest):
         ip = await resolve_host(request.host)
         results = await scan_ports(ip, request.startPort, request.endPort, request.timeoutMs)
         
-        open_ports = [r for r in results if r.status == "open"]
-        closed_ports = [r for r in results if r.status == "closed"]
+        open_count = closed_count = lat_count = 0
+        lat_sum = 0.0
+        for r in results:
+            status = r["status"]
+            if status == "open":
+                open_count += 1
+            elif status == "closed":
+                closed_count += 1
+            if r["latencyMs"] is not None:
+                lat_sum += r["latencyMs"]
+                lat_count += 1
         
-        latencies = [r.latencyMs for r in results if r.latencyMs is not None]
-        avg_latency = sum(latencies) / len(latencies) if latencies else 0
+        avg_latency = lat_sum / lat_count if lat_count else 0
         
         summary = {
             "totalPorts": len(results),
-            "openPorts": len(open_ports),
-            "closedPorts": len(closed_ports),
+            "openPorts": open_count,
+            "closedPorts": closed_count,
             "avgLatencyMs": round(avg_latency, 2)
         }
         
-        logger.info(f"Scan complete: {len(open_ports)} open ports found")
+        logger.info(f"Scan complete: {open_count} open ports found")
         
         return ScanResponse(
             host=request.host,